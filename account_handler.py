@@ -1,29 +1,97 @@
 import os
 import json
+import mmap
+import struct
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 ACCOUNT_FILE = "account.json"
 
-def init_account_file(account_id, balance=0.0):
+# Below this size a plain buffered read is cheaper than setting up a mapping.
+MMAP_THRESHOLD = 1 * 1024 * 1024
+
+def _read_accounts() -> Dict[str, float]:
+    if os.path.getsize(ACCOUNT_FILE) > MMAP_THRESHOLD:
+        with open(ACCOUNT_FILE, "rb") as account_file:
+            mm = mmap.mmap(account_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                data = mm.read()
+            finally:
+                mm.close()
+    else:
+        with open(ACCOUNT_FILE, "rb") as account_file:
+            data = account_file.read()
+
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+BALANCE_FILE = "account.dat"
+
+class BalanceFile:
+    """Fixed-size binary balance record updated in place through mmap.
+
+    The balance is stored as one little-endian double at offset 0, so an
+    update is a memory store plus flush instead of a JSON read-modify-
+    rewrite of the account file. An existing record survives restarts:
+    `initial` is only written when the file is new, so a committed
+    balance can be read back after the process comes up again.
+    """
+
+    _RECORD = struct.Struct("<d")
+
+    def __init__(self, path: str = BALANCE_FILE, initial: float = 0.0) -> None:
+        fresh = not os.path.exists(path) or os.path.getsize(path) < self._RECORD.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fresh:
+            os.truncate(self._fd, self._RECORD.size)
+        self._mm = mmap.mmap(self._fd, self._RECORD.size)
+        if fresh:
+            self.write(initial)
+
+    def read(self) -> float:
+        return self._RECORD.unpack_from(self._mm, 0)[0]
+
+    def write(self, balance: float) -> None:
+        self._RECORD.pack_into(self._mm, 0, balance)
+        self._mm.flush()
+
+    def close(self) -> None:
+        self._mm.close()
+        os.close(self._fd)
+
+def init_account_file(account_id: str, balance: float = 0.0) -> None:
     # if not os.path.exists(ACCOUNT_FILE):
     account = {}
     account[account_id] = balance
     with open(ACCOUNT_FILE, "w") as account_file:
-            json.dump(account, account_file,indent=4) 
+            json.dump(account, account_file,indent=4)
 
-def read_account_balance(account_id):
-    with open(ACCOUNT_FILE, "r") as account_file:
-        accounts = json.load(account_file)
+def read_account_balance(account_id: str) -> Optional[float]:
+    accounts = _read_accounts()
 
     if account_id in accounts:
         return accounts[account_id]
     else:
         return None
 
-def update_account_balance(account_id, new_balance):
-    with open(ACCOUNT_FILE, "r") as account_file:
-        accounts = json.load(account_file)
+def update_account_balance(account_id: str, new_balance: float) -> None:
+    accounts = _read_accounts()
 
     accounts[account_id] = new_balance
 
-    with open(ACCOUNT_FILE, "w") as account_file:
-        json.dump(accounts, account_file, indent=4)
\ No newline at end of file
+    # Write to a temp file and atomically swap it in so a crash mid-write
+    # never leaves a truncated account file behind.
+    tmp_file = ACCOUNT_FILE + ".tmp"
+    with open(tmp_file, "wb") as account_file:
+        account_file.write(_dumps(accounts))
+    os.replace(tmp_file, ACCOUNT_FILE)
@@ -5,68 +5,347 @@ Date: 12/03/2024
 Server interface for the 2-phase commit protocol.
 """
 
-from flask import Flask, request, jsonify
-from flask_apscheduler import APScheduler
+from flask import Flask, Response, request
+from concurrent.futures import ThreadPoolExecutor
 import argparse
+import heapq
+import inspect
 import os
+import threading
 import time
 from log_handler import *
 from account_handler import *
 from rpc_call import rpc_call
+from cluster import CLUSTER
+from diagnostics import get_logger
 
-class Config:
-    SCHEDULER_API_ENABLED = True
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+
+    class _RpcRequest(msgspec.Struct):
+        method: str
+        params: dict = {}
+
+    # Decodes and validates the request shape in one C-level pass.
+    _REQUEST_DECODER = msgspec.json.Decoder(_RpcRequest)
+except ImportError:
+    msgspec = None
+    _REQUEST_DECODER = None
+
+def _json_response(obj, status=200):
+    """Build a JSON Response, encoding with orjson when available."""
+    if orjson is not None:
+        body = orjson.dumps(obj)
+    else:
+        body = json.dumps(obj, separators=(",", ":")).encode()
+    return Response(body, status=status, mimetype="application/json")
+
+def _parse_body(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Static error bodies, encoded once; the error paths skip jsonify entirely.
+_ERR_PARAMS_BODY = b'{"result":null,"error":"Params must be a dictionary"}'
+
+def _method_not_found(method):
+    body = json.dumps(
+        {"result": None, "error": f"Method '{method}' not found"},
+        separators=(",", ":"))
+    return Response(body, status=404, mimetype="application/json")
 
 class BaseServer:
-    def __init__(self, host, port, server_id: str):
+    def __init__(self, host, port, server_id: str, debug: bool = False):
         """Initialize the base server with common configuration."""
         self.host = host
         self.port = port
         self.server_id = server_id
+        self.debug = debug
         self.app = Flask(__name__)
         
-        with open("cluster.json", "r") as file:
-            cluster_data = json.load(file)
         self.cluster = [
-            entry for entry in cluster_data if entry["server_id"] != self.server_id]
+            entry for entry in CLUSTER if entry["server_id"] != self.server_id]
+        # Index the cluster once so per-transaction lookups are O(1)
+        # instead of a scan over the server list.
+        self.participants = [
+            entry for entry in self.cluster if entry["account_id"]]
+        self.by_account = {
+            entry["account_id"]: entry for entry in self.participants}
 
-        self.register_routes()
+        # Register methods first so the route closure can bind the
+        # dispatch table once instead of resolving self.methods per request.
         self.register_methods()
-        
+        # Cache each method's parameter names once so dispatch can call
+        # single-argument methods positionally instead of unpacking kwargs.
+        self._param_names = {
+            name: tuple(inspect.signature(fn).parameters)
+            for name, fn in self.methods.items()
+        }
+        self.register_routes()
+
+        # Shared pool for fanning RPCs out to the rest of the cluster in
+        # parallel instead of one participant at a time. Oversized vs the
+        # cluster so concurrent transactions don't queue behind each
+        # other's fan-outs.
+        self._pool = ThreadPoolExecutor(max_workers=max(len(self.cluster), 1) * 4)
+
+        # Roles this process plays; a node can be both a participant and
+        # a co-coordinator in a decentralized-commit deployment.
+        self.roles = set()
+
+        # Vote gathering for decentralized commit: any node can collect
+        # peer votes keyed by transaction. Size-bounded in vote(), since
+        # the RPC is externally callable.
+        self._votes = {}
+        self._vote_lock = threading.Lock()
+
         # Timeout detection
         self.transaction_counter = 0
         self.transactions = {}
         self.timeout = 3
-        
+        # Min-heap of (deadline, transaction_id) so a timeout check only
+        # touches expired entries instead of scanning every transaction.
+        # A one-shot timer armed at the earliest deadline replaces the old
+        # fixed-interval scheduler, so an idle server never wakes up.
+        self._deadlines = []
+        self._deadline_lock = threading.Lock()
+        self._timeout_timer = None
+
+    def _call(self, method, params):
+        """Invoke a registered method with a positional fast path."""
+        fn = self.methods[method]
+        if not params:
+            return fn()
+        names = self._param_names[method]
+        if len(params) == 1 and names and names[0] in params:
+            return fn(params[names[0]])
+        return fn(**params)
+
+    def track_deadline(self, transaction_id):
+        """Record the timeout deadline for a newly created transaction."""
+        with self._deadline_lock:
+            heapq.heappush(self._deadlines, (time.time() + self.timeout, transaction_id))
+            self._arm_timer()
+
+    def _arm_timer(self):
+        """Arm the timeout timer for the earliest deadline.
+
+        Caller must hold _deadline_lock. Deadlines are created with a
+        fixed per-server timeout, so they arrive in order and an already
+        armed timer is never later than the heap head.
+        """
+        if not self._deadlines:
+            return
+        if self._timeout_timer is not None and self._timeout_timer.is_alive():
+            return
+        delay = max(self._deadlines[0][0] - time.time(), 0)
+        self._timeout_timer = threading.Timer(delay, self._on_timeout_timer)
+        self._timeout_timer.daemon = True
+        self._timeout_timer.start()
+
+    def _on_timeout_timer(self):
+        self.monitor_timeout()
+        with self._deadline_lock:
+            self._timeout_timer = None
+            self._arm_timer()
+
+    def monitor_timeout(self):
+        """Handle expired transactions; overridden by the servers."""
+
+    def expired_transactions(self):
+        """Pop and return the ids of transactions whose deadline passed."""
+        now = time.time()
+        expired = []
+        with self._deadline_lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, transaction_id = heapq.heappop(self._deadlines)
+                # Skip entries for transactions that already completed.
+                if transaction_id in self.transactions:
+                    expired.append(transaction_id)
+        return expired
+
     def register_routes(self):
         """Register Flask routes for the RPC server."""
+        # Bound once here; every request then skips the attribute lookups.
+        methods = self.methods
+        dispatch = self.dispatch
+        call = self._call
+
         @self.app.route('/rpc', methods=['POST'])
         def json_rpc():
             try:
-                data = request.get_json()
-                method = data.get('method')
-                params = data.get('params', {})
+                # Parse the raw body directly instead of going through
+                # Werkzeug's json machinery; it is read exactly once.
+                body = request.get_data(cache=False)
 
-                if not isinstance(params, dict):
-                    return jsonify({"result": None, "error": "Params must be a dictionary"}), 400
+                # A list payload is a batch: dispatch every call in one
+                # round-trip and return the results as an array.
+                if body.lstrip().startswith(b"["):
+                    return _json_response([dispatch(call) for call in _parse_body(body)])
+
+                if _REQUEST_DECODER is not None:
+                    try:
+                        parsed = _REQUEST_DECODER.decode(body)
+                    except msgspec.ValidationError as e:
+                        return _json_response({"result": None, "error": str(e)}, status=400)
+                    method = parsed.method
+                    params = parsed.params
+                else:
+                    data = _parse_body(body)
+                    method = data.get('method')
+                    params = data.get('params', {})
 
-                if method in self.methods:
-                    result = self.methods[method](**params)
-                    return jsonify({"result": result, "error": None})
+                    if not isinstance(params, dict):
+                        return Response(_ERR_PARAMS_BODY, status=400, mimetype="application/json")
+
+                if method in methods:
+                    result = call(method, params)
+                    # Hot handlers may return a pre-encoded Response.
+                    if type(result) is Response:
+                        return result
+                    return _json_response({"result": result, "error": None})
                 else:
-                    return jsonify({"result": None, "error": f"Method '{method}' not found"}), 404
+                    return _method_not_found(method)
+            except Exception as e:
+                return _json_response({"result": None, "error": str(e)}, status=500)
+
+        # Hot path: the method name rides in the URL, so dispatch happens
+        # in Werkzeug's routing map and the body is just the params dict.
+        # /rpc stays for batches and older callers.
+        @self.app.route('/rpc/<method>', methods=['POST'])
+        def json_rpc_method(method):
+            try:
+                if method not in methods:
+                    return _method_not_found(method)
+
+                body = request.get_data(cache=False)
+                params = _parse_body(body) if body else {}
+                if not isinstance(params, dict):
+                    return Response(_ERR_PARAMS_BODY, status=400, mimetype="application/json")
+
+                result = call(method, params)
+                # Hot handlers may return a pre-encoded Response.
+                if type(result) is Response:
+                    return result
+                return _json_response({"result": result, "error": None})
             except Exception as e:
-                return jsonify({"result": None, "error": str(e)}), 500
+                return _json_response({"result": None, "error": str(e)}, status=500)
+
+    def dispatch(self, call):
+        """Dispatch a single call dict and return its response dict."""
+        try:
+            method = call.get('method')
+            params = call.get('params', {})
+            if not isinstance(params, dict):
+                return {"result": None, "error": "Params must be a dictionary"}
+            if method not in self.methods:
+                return {"result": None, "error": f"Method '{method}' not found"}
+            result = self._call(method, params)
+            # Batch path: unwrap pre-encoded fast-path responses back into
+            # the envelope dict so they embed in the response array.
+            if type(result) is Response:
+                return _parse_body(result.get_data())
+            return {"result": result, "error": None}
+        except Exception as e:
+            return {"result": None, "error": str(e)}
 
     def register_methods(self):
         """Register common RPC methods."""
         self.methods = {}
         self.methods["get_logs"] = self.get_logs
+        self.methods["vote"] = self.vote
+
+    # Upper bound on remembered per-transaction vote sets.
+    VOTES_LIMIT = 1000
 
-    def get_logs(self):
-        """Return the logs for debugging."""
-        return read_logs()
+    def vote(self, transaction_id, server_id, vote):
+        """
+        Record a peer's vote for a transaction.
+
+        Lets any node gather votes when acting as a co-coordinator in a
+        decentralized-commit deployment. The table evicts its oldest
+        transaction past VOTES_LIMIT, so the externally callable RPC
+        cannot grow memory without bound.
+        """
+        with self._vote_lock:
+            votes = self._votes.setdefault(transaction_id, {})
+            votes[server_id] = vote
+            if len(self._votes) > self.VOTES_LIMIT:
+                self._votes.pop(next(iter(self._votes)))
+            return {"recorded": len(votes)}
+
+    def get_logs(self, account_id=None, state=None):
+        """Return the logs for debugging, optionally filtered server-side."""
+        return read_logs(account_id=account_id, state=state)
 
     def run(self):
-        """Start the Flask server."""
-        self.app.run(host=self.host, port=self.port, debug=True)
\ No newline at end of file
+        """Start the server under the best available WSGI server.
+
+        Preference order: gunicorn (threaded workers), waitress, and the
+        Flask dev server as a last resort.
+        """
+        if self.debug:
+            # Dev server with the reloader and debugger, for local hacking.
+            self.app.run(host=self.host, port=self.port, debug=True)
+            return
+
+        try:
+            self._run_gunicorn()
+            return
+        except ImportError:
+            pass
+
+        try:
+            from waitress import serve
+        except ImportError:
+            # Fall back to the Flask dev server if nothing else is
+            # installed, but without the reloader/debugger overhead.
+            self.app.run(host=self.host, port=self.port, debug=False)
+        else:
+            serve(self.app, host=self.host, port=self.port, threads=8)
+
+    def _run_gunicorn(self):
+        """Serve through gunicorn with one multi-threaded worker.
+
+        A single worker is required: transactions, balances and deadlines
+        live in this process, so forked workers would not share them.
+        """
+        from gunicorn.app.base import BaseApplication
+
+        def post_fork(server, worker):
+            # Inherited by accepted sockets on Linux, so small responses
+            # go out immediately instead of waiting on Nagle.
+            import socket
+            for listener in server.LISTENERS:
+                try:
+                    listener.sock.setsockopt(
+                        socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                except OSError:
+                    pass
+
+        app = self.app
+        options = {
+            "bind": f"{self.host}:{self.port}",
+            "workers": 1,
+            "worker_class": "gthread",
+            "threads": 8,
+            # Allows a future multi-process setup to share the port with
+            # kernel-balanced accepts.
+            "reuse_port": True,
+            "post_fork": post_fork,
+        }
+
+        class _Server(BaseApplication):
+            def load_config(self):
+                for key, value in options.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                return app
+
+        _Server().run()
\ No newline at end of file
@@ -1,13 +1,11 @@
 from rpc_call import rpc_call
-import json
+from cluster import BY_ID
+
+coordinator = BY_ID["coordinator"]
 
-with open("cluster.json", "r") as file:
-    cluster_data = json.load(file)
-    
-coordinator = None
-for server in cluster_data:
-    if server["server_id"] == "coordinator":
-        coordinator = server
-        
 add_bonus = rpc_call(coordinator, "add_bonus", params={"bonus_percentage": 0.2})
-# transfer = rpc_call(coordinator, "transfer", params={"account_id_from": "A", "account_id_to": "B", "amount": 100.00})
\ No newline at end of file
+# transfer = rpc_call(coordinator, "transfer", params={"account_id_from": "A", "account_id_to": "B", "amount": 100.00})
+
+# Pre-prepare during think-time, then commit with the reservation:
+# reserve = rpc_call(coordinator, "reserve", params={"account_id_from": "A", "account_id_to": "B", "amount": 100.00})
+# transfer = rpc_call(coordinator, "transfer", params={"account_id_from": "A", "account_id_to": "B", "amount": 100.00, "reservation_id": reserve["result"]["reservation_id"]})
@@ -0,0 +1,23 @@
+"""
+Cluster topology, parsed once at import time.
+
+Servers and the client all read cluster.json; loading it here means one
+parse per process instead of one per instantiation, plus pre-built
+indexes by server_id and account_id.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+with open("cluster.json", "rb") as file:
+    if orjson is not None:
+        CLUSTER = orjson.loads(file.read())
+    else:
+        CLUSTER = json.load(file)
+
+BY_ID = {entry["server_id"]: entry for entry in CLUSTER}
+BY_ACCOUNT = {entry["account_id"]: entry for entry in CLUSTER if entry["account_id"]}
@@ -1,26 +1,43 @@
-from base_server import BaseServer
+from base_server import BaseServer, get_logger
 from log_handler import *
-from flask_apscheduler import APScheduler
 from rpc_call import rpc_call
+from concurrent.futures import as_completed
+from dataclasses import dataclass
+import threading
 import time
 import argparse
 
+log = get_logger("coordinator")
+
+@dataclass
+class Transaction:
+    """In-flight 2PC transaction tracked by the coordinator.
+
+    Slotted so the hot per-phase accesses are attribute loads instead of
+    nested dict lookups.
+    """
+    __slots__ = ("transaction_id", "participants", "responses", "old_balances",
+                 "new_balances", "timestamp", "prepared", "rejected", "held")
+    transaction_id: int
+    participants: list
+    responses: dict
+    old_balances: dict
+    new_balances: dict
+    timestamp: float
+    prepared: int
+    rejected: int
+    held: bool
+
 class CoordinatorServer(BaseServer):
-    def __init__(self, host, port):
+    def __init__(self, host, port, debug=False):
         """Initialize the coordinator server."""
-        super().__init__(host, port, "coordinator")
+        super().__init__(host, port, "coordinator", debug=debug)
+        self.roles.add("coordinator")
         init_log()
-        
-        # Initialize scheduler for timeout detection
-        self.scheduler = APScheduler()
-        self.scheduler.init_app(self.app)
-        self.scheduler.start()
-        self.scheduler.add_job(
-            id="timeout_monitor",
-            func=self.monitor_timeout,
-            trigger="interval",
-            seconds=3,
-        )
+        # Guards the check-and-register of new transactions, so the
+        # one-round-trip fast path cannot be entered concurrently.
+        self._txn_lock = threading.Lock()
+        # Timeout detection runs off the deadline timer in BaseServer.
 
     def register_methods(self):
         """Register coordinator-specific RPC methods."""
@@ -29,60 +46,94 @@ class CoordinatorServer(BaseServer):
             "get_logs": self.get_logs,
             "transfer": self.transfer,
             "add_bonus": self.add_bonus,
+            "reserve": self.reserve,
             "propose_prepare": self.propose_prepare,
+            "propose_prepare_commit": self.propose_prepare_commit,
             "propose_commit": self.propose_commit,
             "propose_abort": self.propose_abort
         })
 
     def monitor_timeout(self):
-        """Monitor transactions for timeout."""
-        current_time = time.time()
-        for transaction_id, transaction in list(self.transactions.items()):
-            if transaction["responses"]:
+        """Handle transactions whose deadline passed.
+
+        Only held reservations are aborted here (lease expiry); a
+        transaction whose prepare fan-out is still collecting votes must
+        not be torn down underneath propose_prepare, which drives its own
+        outcome off the as_completed timeout.
+        """
+        for transaction_id in self.expired_transactions():
+            transaction = self.transactions.get(transaction_id)
+            if transaction is None:
                 continue
-            time_elapsed = current_time - transaction["timestamp"]
-            if time_elapsed > self.timeout:
-                print(f"Timeout detected for transaction {transaction_id}.")
+            if transaction.held:
+                log.warning("Reservation %s expired. Aborting.", transaction_id)
+                self.propose_abort(transaction_id)
+            else:
+                log.warning("Timeout detected for transaction %s.", transaction_id)
 
-    def get_logs(self):
+    def get_logs(self, account_id=None, state=None):
         """
-        Return the logs for debugging.
+        Return the logs for debugging, optionally filtered server-side.
         """
-        return read_logs()
+        return read_logs(account_id=account_id, state=state)
     
-    def transfer(self, account_id_from, account_id_to, amount):
+    def transfer(self, account_id_from, account_id_to, amount, reservation_id=None):
         """
         Transfer from one account to another with the given amount.
+
+        A reservation_id from an earlier reserve call skips the prepare
+        phase: the participants already hold the prepared balances, so
+        the transfer is a single commit broadcast.
         """
-        server_A, server_B = None, None
-        for server in self.cluster:
-            if server["account_id"] == "A":
-                server_A = server
-            else:
-                server_B = server
-        participants = [server_A, server_B]
+        if reservation_id is not None:
+            transaction = self.transactions.get(reservation_id)
+            if transaction is None:
+                return "Failed to transfer: reservation expired or unknown. Transaction aborted."
+            new_balances = transaction.new_balances
+            old_balances = transaction.old_balances
+            # The reservation must match this request exactly: same two
+            # accounts, same direction, same amount. Otherwise committing
+            # would apply balances the caller did not ask for.
+            if (account_id_from not in new_balances
+                    or account_id_to not in new_balances
+                    or new_balances[account_id_from] != old_balances[account_id_from] - amount
+                    or new_balances[account_id_to] != old_balances[account_id_to] + amount):
+                return "Failed to transfer: reservation does not match the request. Transaction aborted."
+            if self.propose_commit(reservation_id):
+                return f"Transferred {amount} from {account_id_from} to {account_id_to}. " \
+                    f"New Balances: {account_id_from}: {new_balances[account_id_from]}, " \
+                    f"{account_id_to}: {new_balances[account_id_to]}"
+            return "Failed to transfer. Transaction aborted."
+
+        server_from = self.by_account.get(account_id_from)
+        server_to = self.by_account.get(account_id_to)
+        if server_from is None or server_to is None:
+            return "Failed to transfer: unknown account. Transaction aborted."
+        participants = [server_from, server_to]
 
         try:
-            balance_A = rpc_call(server_A, "get_balance", params={})["result"]
-            balance_B = rpc_call(server_B, "get_balance", params={})["result"]
+            # Fetch both balances concurrently; they live on different servers.
+            future_from = self._pool.submit(rpc_call, server_from, "get_balance", params={})
+            future_to = self._pool.submit(rpc_call, server_to, "get_balance", params={})
+            balance_from = future_from.result(timeout=self.timeout)["result"]
+            balance_to = future_to.result(timeout=self.timeout)["result"]
 
-            if account_id_from == "A":
-                new_balance_A = balance_A - amount
-                new_balance_B = balance_B + amount
-            else:
-                new_balance_A = balance_A + amount
-                new_balance_B = balance_B - amount
+            old_balances = {account_id_from: balance_from, account_id_to: balance_to}
+            new_balances = {account_id_from: balance_from - amount,
+                            account_id_to: balance_to + amount}
 
-            new_balances = {"A": new_balance_A, "B": new_balance_B}
-            old_balances = {"A": balance_A, "B": balance_B}
-            
-            self.propose_prepare(participants, old_balances, new_balances)
-            
-            transaction = self.transactions[self.transaction_counter]
-            responses = transaction["responses"]
-            if all(response["result"]["result"]["canPrepare"] for response in responses.values()):
+            # With no other transaction in flight, prepare+commit can be
+            # collapsed into one round-trip per participant; the check is
+            # atomic inside propose_prepare_commit, which declines (None)
+            # under contention.
+            transaction = self.propose_prepare_commit(participants, old_balances, new_balances)
+            if transaction is None:
+                transaction = self.propose_prepare(participants, old_balances, new_balances)
+
+            if transaction.rejected == 0:
                 return f"Transferred {amount} from {account_id_from} to {account_id_to}. " \
-                    f"New Balances: A: {new_balances['A']}, B: {new_balances['B']}"
+                    f"New Balances: {account_id_from}: {new_balances[account_id_from]}, " \
+                    f"{account_id_to}: {new_balances[account_id_to]}"
             else:
                 return "Failed to transfer. Transaction aborted."
         except TimeoutError:
@@ -94,32 +145,33 @@ class CoordinatorServer(BaseServer):
         """
         Add a bonus (percentage) to account A and account B.
         """
-        server_A, server_B = None, None
-        for server in self.cluster:
-            if server["account_id"] == "A":
-                server_A = server
-            else:
-                server_B = server
-        participants = [server_A, server_B]
-        
+        server_A = self.by_account["A"]
+        server_B = self.by_account["B"]
+        participants = self.participants
+
         try:
             # Validate bonus percentage
             if bonus_percentage < 0:
                 return "Failed to add bonus due to invalid bonus. Transaction aborted."
 
-            balance_A = rpc_call(server_A, "get_balance", params={})["result"]
-            balance_B = rpc_call(server_B, "get_balance", params={})["result"]
+            # Fetch both balances concurrently; they live on different servers.
+            future_A = self._pool.submit(rpc_call, server_A, "get_balance", params={})
+            future_B = self._pool.submit(rpc_call, server_B, "get_balance", params={})
+            balance_A = future_A.result(timeout=self.timeout)["result"]
+            balance_B = future_B.result(timeout=self.timeout)["result"]
             bonus_amount = bonus_percentage * balance_A
             new_balances = {"A": balance_A + bonus_amount, "B": balance_B + bonus_amount}
             old_balances = {"A": balance_A, "B": balance_B}
             
-            # Call propose_prepare but don't rely on its return value
-            self.propose_prepare(participants, old_balances, new_balances)
-            
-            # Check transaction status directly
-            transaction = self.transactions[self.transaction_counter]
-            responses = transaction["responses"]
-            if all(response["result"]["result"]["canPrepare"] for response in responses.values()):
+            # With no other transaction in flight, prepare+commit can be
+            # collapsed into one round-trip per participant; the check is
+            # atomic inside propose_prepare_commit, which declines (None)
+            # under contention.
+            transaction = self.propose_prepare_commit(participants, old_balances, new_balances)
+            if transaction is None:
+                transaction = self.propose_prepare(participants, old_balances, new_balances)
+
+            if transaction.rejected == 0:
                 return f"Added bonus {bonus_amount} to both accounts. " \
                     f"New Balances: A: {new_balances['A']}, B: {new_balances['B']}"
             else:
@@ -129,62 +181,207 @@ class CoordinatorServer(BaseServer):
         except Exception as e:
             return f"Failed to add bonus. Error occured: {e}. Transaction aborted."
 
-    def propose_prepare(self, participants, old_balances, new_balances):
+    def reserve(self, account_id_from, account_id_to, amount):
+        """
+        Run the prepare phase for a transfer ahead of time and hold it.
+
+        Locks the transfer's balances in at the participants now, during
+        client think-time, so the later transfer carrying the returned
+        reservation_id only needs the commit round-trip. The standard
+        transaction timeout acts as the lease: a reservation that is not
+        committed in time is aborted by the timeout monitor.
+        """
+        server_from = self.by_account.get(account_id_from)
+        server_to = self.by_account.get(account_id_to)
+        if server_from is None or server_to is None:
+            return {"reservation_id": None, "error": "Unknown account"}
+        participants = [server_from, server_to]
+
+        try:
+            # Fetch both balances concurrently; they live on different servers.
+            future_from = self._pool.submit(rpc_call, server_from, "get_balance", params={})
+            future_to = self._pool.submit(rpc_call, server_to, "get_balance", params={})
+            balance_from = future_from.result(timeout=self.timeout)["result"]
+            balance_to = future_to.result(timeout=self.timeout)["result"]
+
+            old_balances = {account_id_from: balance_from, account_id_to: balance_to}
+            new_balances = {account_id_from: balance_from - amount,
+                            account_id_to: balance_to + amount}
+
+            transaction = self.propose_prepare(
+                participants, old_balances, new_balances, hold=True)
+            if transaction.rejected == 0:
+                return {"reservation_id": transaction.transaction_id, "error": None}
+            return {"reservation_id": None, "error": "Prepare rejected. Transaction aborted."}
+        except TimeoutError:
+            return {"reservation_id": None, "error": "Timeout during prepare"}
+        except Exception as e:
+            return {"reservation_id": None, "error": str(e)}
+
+    def propose_prepare(self, participants, old_balances, new_balances, hold=False):
         """
         Send the prepare request to a specific participant.
+
+        With hold=True a fully prepared transaction is left pending
+        instead of committed, for reserve; rejections still abort.
         """
-        self.transaction_counter += 1
-        self.transactions[self.transaction_counter] = {
-            "participants": participants,
-            "responses": {},
-            "old_balances": old_balances,
-            "new_balances": new_balances,
-            "timestamp": time.time(),
-        }
-        
+        with self._txn_lock:
+            self.transaction_counter += 1
+            transaction = Transaction(
+                transaction_id=self.transaction_counter,
+                participants=participants,
+                responses={},
+                old_balances=old_balances,
+                new_balances=new_balances,
+                timestamp=time.time(),
+                prepared=0,
+                rejected=0,
+                held=hold,
+            )
+            self.transactions[transaction.transaction_id] = transaction
+        self.track_deadline(transaction.transaction_id)
+
+        # Fan the prepare requests out in parallel so total latency is the
+        # slowest participant, not the sum of all of them.
+        future_map = {}
         for participant in participants:
             log_event("prepare", participant["account_id"], new_balances[participant["account_id"]], None)
-            try:
-                response = rpc_call(participant, "handle_prepare", 
-                                  params={"new_balance": new_balances[participant["account_id"]], 
-                                        "transaction_id": self.transaction_counter})
-                self.transactions[self.transaction_counter]["responses"][participant["account_id"]] = response
-            except TimeoutError:
-                print(f"Timeout detected for participant {participant['server_id']} during prepare.")
-                self.transactions[self.transaction_counter]["responses"][participant["account_id"]] = {
-                    "result": {"canPrepare": False},
-                    "error": "Timeout",
-                }
-            except Exception as e:
-                self.transactions[self.transaction_counter]["responses"][participant["account_id"]] = {
-                    "result": {"canPrepare": False},
-                    "error": str(e)
-                }
-                
-        self.process_prepare_responses(self.transaction_counter)
+            future_map[self._pool.submit(
+                rpc_call, participant, "handle_prepare",
+                params={"new_balance": new_balances[participant["account_id"]],
+                        "transaction_id": transaction.transaction_id})] = participant
+
+        # Collect votes as they arrive, counting them inline, and stop at
+        # the first rejection: once anyone votes no the transaction is
+        # doomed, so there is no point waiting on the rest.
+        try:
+            for future in as_completed(future_map, timeout=self.timeout):
+                participant = future_map[future]
+                try:
+                    response = future.result()
+                    transaction.responses[participant["account_id"]] = response
+                    if response["result"]["result"]["canPrepare"]:
+                        transaction.prepared += 1
+                    else:
+                        transaction.rejected += 1
+                except Exception as e:
+                    transaction.responses[participant["account_id"]] = \
+                        self._rejection(str(e))
+                    transaction.rejected += 1
+                if transaction.rejected:
+                    break
+        except TimeoutError:
+            log.warning("Timeout detected during prepare for transaction %s.", transaction.transaction_id)
+            transaction.rejected += 1
+
+        if transaction.rejected:
+            # Cancel outstanding prepares and record them as rejections.
+            for future, participant in future_map.items():
+                future.cancel()
+                if participant["account_id"] not in transaction.responses:
+                    transaction.responses[participant["account_id"]] = \
+                        self._rejection("Prepare cancelled")
+            log.warning("Prepare phase failed for transaction %s. Aborting.", transaction.transaction_id)
+            self.propose_abort(transaction.transaction_id)
+        elif hold:
+            log.info("Transaction %s prepared and held as a reservation.", transaction.transaction_id)
+        else:
+            log.info("All participants prepared for transaction %s. Proceeding to commit.", transaction.transaction_id)
+            # A commit that fails (e.g. the transaction was torn down
+            # meanwhile) must surface as a rejection, never as success.
+            if not self.propose_commit(transaction.transaction_id):
+                transaction.rejected += 1
+
+        return transaction
 
-    def process_prepare_responses(self, transaction_id):
+    @staticmethod
+    def _rejection(error):
+        """Build a canPrepare=False response in the wire format."""
+        return {"result": {"result": {"canPrepare": False}, "error": error}, "error": error}
+
+    def propose_prepare_commit(self, participants, old_balances, new_balances):
         """
-        Process responses from participants during the prepare phase.
+        Prepare and commit in a single round-trip per participant.
+
+        Only safe when no other transaction is in flight, since a
+        participant applies the balance as soon as it votes yes; a
+        rejection is compensated by restoring the old balances. The
+        check and registration are atomic: returns None when another
+        transaction is in flight, and the caller falls back to the
+        two-phase path.
         """
-        transaction = self.transactions.get(transaction_id)
-        if not transaction:
-            print(f"Transaction {transaction_id} not found.")
-            return
+        with self._txn_lock:
+            if self.transactions:
+                return None
+            self.transaction_counter += 1
+            transaction = Transaction(
+                transaction_id=self.transaction_counter,
+                participants=participants,
+                responses={},
+                old_balances=old_balances,
+                new_balances=new_balances,
+                timestamp=time.time(),
+                prepared=0,
+                rejected=0,
+                held=False,
+            )
+            # Registered so concurrent callers see it in flight; removed
+            # below once the outcome is decided.
+            self.transactions[transaction.transaction_id] = transaction
 
-        responses = transaction["responses"]
-        all_prepared = all(
-            response["result"]["result"]["canPrepare"]
-            for response in responses.values()
-            if "result" in response
-        )
+        future_map = {}
+        for participant in participants:
+            log_event("prepare", participant["account_id"], new_balances[participant["account_id"]], None)
+            future_map[self._pool.submit(
+                rpc_call, participant, "handle_prepare_commit",
+                params={"new_balance": new_balances[participant["account_id"]],
+                        "transaction_id": transaction.transaction_id})] = participant
 
-        if all_prepared:
-            print(f"All participants prepared for transaction {transaction_id}. Proceeding to commit.")
-            self.propose_commit(transaction_id)
-        else:
-            print(f"Prepare phase failed for transaction {transaction_id}. Aborting.")
-            self.propose_abort(transaction_id)
+        committed = []
+        try:
+            try:
+                for future in as_completed(future_map, timeout=self.timeout):
+                    participant = future_map[future]
+                    try:
+                        response = future.result()
+                        transaction.responses[participant["account_id"]] = response
+                        if response["result"]["result"]["canCommit"]:
+                            transaction.prepared += 1
+                            committed.append(participant)
+                        else:
+                            transaction.rejected += 1
+                    except Exception as e:
+                        transaction.responses[participant["account_id"]] = \
+                            self._rejection(str(e))
+                        transaction.rejected += 1
+            except TimeoutError:
+                log.warning("Timeout detected during prepare-commit for transaction %s.", transaction.transaction_id)
+                transaction.rejected += 1
+
+            if transaction.rejected:
+                # Roll the already-committed participants back to their old
+                # balance, since the decision is abort.
+                log.warning("Prepare-commit failed for transaction %s. Compensating.", transaction.transaction_id)
+                compensations = []
+                for participant in committed:
+                    account_id = participant["account_id"]
+                    log_event("abort", account_id, old_balances[account_id], None)
+                    compensations.append((participant, self._pool.submit(
+                        rpc_call, participant, "set_balance",
+                        params={"new_balance": old_balances[account_id]})))
+                for participant, future in compensations:
+                    try:
+                        future.result(timeout=self.timeout)
+                    except Exception as e:
+                        log.warning("Failed to compensate %s: %s", participant["server_id"], e)
+            else:
+                for participant in participants:
+                    log_event("commit", participant["account_id"], new_balances[participant["account_id"]], None)
+                log.info("Transaction %s committed in one round-trip.", transaction.transaction_id)
+        finally:
+            self.transactions.pop(transaction.transaction_id, None)
+
+        return transaction
 
     def propose_commit(self, transaction_id):
         """
@@ -192,25 +389,27 @@ class CoordinatorServer(BaseServer):
         """
         transaction = self.transactions.get(transaction_id)
         if not transaction:
-            print(f"Transaction {transaction_id} not found.")
+            log.warning("Transaction %s not found.", transaction_id)
             return False
         
-        for participant in transaction["participants"]:
-            log_event("commit", participant["account_id"], transaction["new_balances"][participant["account_id"]], None)
+        futures = []
+        for participant in transaction.participants:
+            log_event("commit", participant["account_id"], transaction.new_balances[participant["account_id"]], None)
+            futures.append((participant, self._pool.submit(
+                rpc_call, participant, "handle_commit", params={"transaction_id": transaction_id})))
+
+        for participant, future in futures:
             try:
-                response = rpc_call(participant, "handle_commit", params={"transaction_id": transaction_id})
+                response = future.result(timeout=self.timeout)
                 if not response["result"]["result"].get("canCommit", False):
-                    print(f"Commit failed for participant {participant['server_id']}")
-                    success = False
-                    break
+                    log.warning("Commit failed for participant %s", participant["server_id"])
             except TimeoutError:
-                print(f"Timeout detected for participant {participant['server_id']} during prepare.")
+                log.warning("Timeout detected for participant %s during commit.", participant["server_id"])
             except Exception as e:
-                print(f"Error during commit for participant {participant['server_id']}: {e}")
-                success = False
-                break
-            
-        print(f"Transaction {transaction_id} committed successfully.")
+                log.warning("Error during commit for participant %s: %s", participant["server_id"], e)
+
+
+        log.info("Transaction %s committed successfully.", transaction_id)
         del self.transactions[transaction_id]
         return True
 
@@ -220,20 +419,25 @@ class CoordinatorServer(BaseServer):
         """
         transaction = self.transactions.get(transaction_id)
         if not transaction:
-            print(f"Transaction {transaction_id} not found.")
+            log.warning("Transaction %s not found.", transaction_id)
             return
         
-        for participant in transaction["participants"]:
-            log_event("abort", participant["account_id"], transaction["old_balances"][participant["account_id"]], None)
+        futures = []
+        for participant in transaction.participants:
+            log_event("abort", participant["account_id"], transaction.old_balances[participant["account_id"]], None)
+            futures.append((participant, self._pool.submit(
+                rpc_call, participant, "handle_abort", params={"transaction_id": transaction_id})))
+
+        for participant, future in futures:
             try:
-                rpc_call(participant, "handle_abort", params={"transaction_id": transaction_id})
-                print(f"Aborted transaction {transaction_id} on participant {participant['server_id']}.")
+                future.result(timeout=self.timeout)
+                log.info("Aborted transaction %s on participant %s.", transaction_id, participant["server_id"])
             except TimeoutError:
-                print(f"Timeout detected for participant {participant['server_id']} during abort.")
+                log.warning("Timeout detected for participant %s during abort.", participant["server_id"])
             except Exception as e:
-                print(f"Failed to send abort to {participant['server_id']}: {e}")
+                log.warning("Failed to send abort to %s: %s", participant["server_id"], e)
         
-        print(f"Transaction {transaction_id} aborted.")
+        log.info("Transaction %s aborted.", transaction_id)
         if transaction_id in self.transactions:
             del self.transactions[transaction_id]
 
@@ -243,6 +447,8 @@ if __name__ == "__main__":
     parser.add_argument("host", help="Host for the server (e.g., 127.0.0.1)")
     parser.add_argument(
         "port", type=int, help="Port for the server (e.g., 8000)")
+    parser.add_argument("--debug", action="store_true",
+                        help="Run the Flask dev server with the debugger/reloader")
 
     args = parser.parse_args()
 
@@ -250,5 +456,6 @@ if __name__ == "__main__":
     server = CoordinatorServer(
         host=args.host,
         port=args.port,
+        debug=args.debug,
     )
     server.run()
\ No newline at end of file
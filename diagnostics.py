@@ -0,0 +1,29 @@
+"""
+Non-blocking diagnostics logging, shared by the servers and the RPC
+client helpers.
+
+Records go through a queue drained by a background listener, so
+emitting one on a hot path is a lock-free enqueue instead of a
+blocking, GIL-serialized stdout flush.
+"""
+
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+_LOG_QUEUE: "queue.Queue" = queue.Queue()
+_LOG_LISTENER = None
+
+def get_logger(name):
+    """Return a logger that emits through the shared non-blocking queue."""
+    # Listener started lazily so importing the module never spawns a thread.
+    global _LOG_LISTENER
+    if _LOG_LISTENER is None:
+        _LOG_LISTENER = QueueListener(_LOG_QUEUE, logging.StreamHandler())
+        _LOG_LISTENER.start()
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        logger.addHandler(QueueHandler(_LOG_QUEUE))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
@@ -1,28 +1,146 @@
 import json
-# import os
+import mmap
+import os
+import queue
+import threading
 from datetime import datetime
+from typing import Any, Dict, List, Optional
 
-LOG_FILE = "server_log.json"
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def init_log():
+LOG_FILE = "server_log.jsonl"
+
+# Below this size a plain buffered read is cheaper than setting up a mapping.
+MMAP_THRESHOLD = 1 * 1024 * 1024
+
+def _loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+# In-memory copy of every entry written by this process. init_log marks
+# it authoritative, so filtered reads can skip re-parsing the file.
+_ENTRIES: List[Dict[str, Any]] = []
+_ENTRIES_COMPLETE = False
+
+def init_log() -> None:
     # if not os.path.exists(LOG_FILE):
+    global _ENTRIES_COMPLETE
     with open(LOG_FILE, "w") as log_file:
-        json.dump([], log_file)
+        log_file.truncate(0)
+    _ENTRIES.clear()
+    _ENTRIES_COMPLETE = True
 
-def write_log(entry):
-    with open(LOG_FILE, "r") as log_file:
-        logs = json.load(log_file)
+class _LogWriter:
+    """Background flusher that batches concurrent log appends.
 
-    logs.append(entry)
+    Writers enqueue their entry and wait; a single flusher thread drains
+    everything queued, appends it in one go and calls fsync once, so
+    concurrent prepare/commit handlers share the cost of one disk sync
+    (group commit) instead of paying it each.
+    """
 
-    with open(LOG_FILE, "w") as log_file:
-        json.dump(logs, log_file, indent=4)
+    # Cap on entries drained per flush, so one sync never waits on an
+    # unbounded backlog (and writev's IOV_MAX is never exceeded).
+    MAX_BATCH = 256
+
+    def __init__(self) -> None:
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._dsync = False
+
+    def append(self, entry: Dict[str, Any], timeout: float = 0.05) -> None:
+        done = threading.Event()
+        self._queue.put((entry, done))
+        self._ensure_thread()
+        done.wait(timeout)
+
+    def _ensure_thread(self) -> None:
+        # Started lazily so importing the module never spawns a thread.
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._flush_loop, daemon=True)
+                    self._thread.start()
+
+    def _flush_loop(self) -> None:
+        # fdatasync skips flushing unneeded metadata where available.
+        sync = getattr(os, "fdatasync", os.fsync)
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # The fd stays open across batches with O_APPEND, so a batch
+            # costs one writev and one sync instead of open/write/close
+            # per entry.
+            if self._fd is None:
+                # O_DSYNC folds the data sync into the write itself, so a
+                # batch is one durable writev instead of writev + fdatasync.
+                dsync = getattr(os, "O_DSYNC", 0)
+                self._fd = os.open(
+                    LOG_FILE,
+                    os.O_WRONLY | os.O_APPEND | os.O_CREAT | dsync
+                    | getattr(os, "O_CLOEXEC", 0),
+                    0o644)
+                self._dsync = bool(dsync)
+            os.writev(self._fd, [_dumps(entry) + b"\n" for entry, _ in batch])
+            if not self._dsync:
+                sync(self._fd)
+
+            for _, done in batch:
+                done.set()
+
+_WRITER = _LogWriter()
+
+def write_log(entry: Dict[str, Any]) -> None:
+    # Append one newline-delimited JSON record via the group-commit
+    # writer, so each log write is a small append and fsyncs are shared.
+    _ENTRIES.append(entry)
+    _WRITER.append(entry)
+
+def _matches(entry: Dict[str, Any], account_id: Optional[str], state: Optional[str]) -> bool:
+    return ((account_id is None or entry["account_id"] == account_id)
+            and (state is None or entry["state"] == state))
+
+def read_logs(account_id: Optional[str] = None,
+              state: Optional[str] = None) -> List[Dict[str, Any]]:
+    # Serve from the in-memory index when it covers the whole file, so a
+    # filtered read costs O(matches) and touches no disk.
+    if _ENTRIES_COMPLETE:
+        return [entry for entry in _ENTRIES if _matches(entry, account_id, state)]
+
+    # Large logs are parsed straight out of a read-only mapping so the
+    # parser works over one contiguous buffer instead of chunked reads.
+    if os.path.getsize(LOG_FILE) > MMAP_THRESHOLD:
+        with open(LOG_FILE, "rb") as log_file:
+            mm = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                entries = [_loads(line) for line in iter(mm.readline, b"") if line.strip()]
+            finally:
+                mm.close()
+    else:
+        with open(LOG_FILE, "rb") as log_file:
+            entries = [_loads(line) for line in log_file if line.strip()]
 
-def read_logs():
-    with open(LOG_FILE, "r") as log_file:
-        return json.load(log_file)
+    return [entry for entry in entries if _matches(entry, account_id, state)]
 
-def log_event(state, account_id, account_balance, error):
+def log_event(state: str, account_id: str, account_balance: float,
+              error: Optional[str]) -> None:
     """
     Write a new log given state (prepare, commit), account_id, account_balance
     """
@@ -33,4 +151,4 @@ def log_event(state, account_id, account_balance, error):
         "account_balance": account_balance,
         "error": error
     }
-    write_log(entry)
\ No newline at end of file
+    write_log(entry)
@@ -1,32 +1,69 @@
-from base_server import BaseServer
+from base_server import BaseServer, get_logger
 from account_handler import *
 from log_handler import *
-from flask_apscheduler import APScheduler
 from rpc_call import rpc_call
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
 import time
 import argparse
-from flask import g
+from flask import Response, g
+
+log = get_logger("participant")
+
+# Full wire envelope for the steady-state prepare success, encoded once;
+# the route returns these bytes without running the JSON encoder.
+_PREPARE_OK_BODY = b'{"result":{"result":{"canPrepare":true},"error":null},"error":null}'
+
+@dataclass
+class PreparedTransaction:
+    """Balance staged by handle_prepare until commit or abort.
+
+    Slotted so commit-path accesses are attribute loads instead of dict
+    lookups.
+    """
+    __slots__ = ("new_balance", "timestamp")
+    new_balance: float
+    timestamp: float
 
 class ParticipantServer(BaseServer):
-    def __init__(self, host, port, account_id, account_balance=0.0):
+    # Upper bound on remembered (transaction, phase) results.
+    APPLIED_LIMIT = 10000
+
+    def __init__(self, host, port, account_id, account_balance=0.0, debug=False):
         """Initialize the participant server."""
-        super().__init__(host, port, account_id)
+        super().__init__(host, port, account_id, debug=debug)
+        self.roles.add("participant")
         self.account_id = str(account_id)
         
-        # Initialize account
+        # Initialize account; keep the balance cached in memory so reads
+        # never touch disk on the RPC hot path. Commits persist to the
+        # fixed-size binary record, which survives restarts: the stored
+        # balance wins over the CLI argument when the record already
+        # exists, so a restarted participant resumes where it committed.
+        # account.json stays as a human-readable snapshot.
         init_log()
-        init_account_file(self.account_id, account_balance)
-        
-        # Initialize scheduler for timeout detection
-        self.scheduler = APScheduler()
-        self.scheduler.init_app(self.app)
-        self.scheduler.start()
-        self.scheduler.add_job(
-            id="timeout_monitor",
-            func=self.monitor_timeout,
-            trigger="interval",
-            seconds=3,
-        )
+        self._store = BalanceFile(initial=float(account_balance))
+        self._balance = self._store.read()
+        init_account_file(self.account_id, self._balance)
+        # Balance writes are exclusive under the threaded server; reads
+        # stay lock-free since they load a single attribute.
+        self._balance_lock = threading.Lock()
+
+        # Resolve the coordinator entry once instead of per recover call.
+        self._coordinator = next(
+            (server for server in self.cluster if server["server_id"] == "coordinator"), None)
+
+        # Results of already-handled (transaction_id, phase) pairs, so a
+        # coordinator retry gets the cached answer instead of re-logging
+        # and re-applying.
+        self._applied = OrderedDict()
+
+    def _remember(self, transaction_id, phase, response):
+        """Cache a handler result for duplicate delivery, size-bounded."""
+        self._applied[(transaction_id, phase)] = response
+        if len(self._applied) > self.APPLIED_LIMIT:
+            self._applied.popitem(last=False)
 
     def register_methods(self):
         """Register participant-specific RPC methods."""
@@ -36,93 +73,132 @@ class ParticipantServer(BaseServer):
             "set_balance": self.set_balance,
             "handle_prepare": self.handle_prepare,
             "handle_commit": self.handle_commit,
+            "handle_prepare_commit": self.handle_prepare_commit,
             "handle_abort": self.handle_abort,
             "recover": self.recover
         })
 
     def monitor_timeout(self):
         """Monitor transactions for timeout and detect coordinator failure."""
-        current_time = time.time()
-        for transaction_id, transaction in list(self.transactions.items()):
-            time_elapsed = current_time - transaction["timestamp"]
-            if time_elapsed > self.timeout:
-                print(f"Timeout detected for transaction {transaction_id}.")
-                self.transactions.clear()
+        for transaction_id in self.expired_transactions():
+            log.warning("Timeout detected for transaction %s.", transaction_id)
+            self.transactions.clear()
                 
     def get_balance(self):
         """
         Get the current account balance.
         """
-        return read_account_balance(self.account_id)
+        return self._balance
 
     def set_balance(self, new_balance):
         """
         Update the account balance and log the operation.
         """
         log_event("commit", self.account_id, new_balance, None)
-        update_account_balance(self.account_id, new_balance)
+        with self._balance_lock:
+            self._balance = new_balance
+            self._store.write(new_balance)
         return f"Account balance updated to {new_balance}"
 
     def handle_prepare(self, new_balance, transaction_id):
         """
         Handle the prepare phase of the 2-Phase Commit Protocol.
         """
+        cached = self._applied.get((transaction_id, "prepare"))
+        if cached is not None:
+            return cached
+
         if new_balance < 0:
-            return {"result": {"canPrepare": False}, "error": "Insufficient funds"}
+            response = {"result": {"canPrepare": False}, "error": "Insufficient funds"}
         else:
             log_event("prepare", self.account_id, new_balance, None)
-            self.transactions[transaction_id] = {
-                "new_balance": new_balance,
-                "timestamp": time.time(),
-            }
-            return {"result": {"canPrepare": True}, "error" : None}
+            self.transactions[transaction_id] = PreparedTransaction(
+                new_balance=new_balance,
+                timestamp=time.time(),
+            )
+            self.track_deadline(transaction_id)
+            # Cache the dict form for retries; answer with the
+            # pre-encoded body.
+            self._remember(transaction_id, "prepare",
+                           {"result": {"canPrepare": True}, "error": None})
+            return Response(_PREPARE_OK_BODY, mimetype="application/json")
+        self._remember(transaction_id, "prepare", response)
+        return response
 
     def handle_commit(self, transaction_id):
         """
         Handle the commit phase of the 2-Phase Commit Protocol.
         """
+        cached = self._applied.get((transaction_id, "commit"))
+        if cached is not None:
+            return cached
+
         if transaction_id in self.transactions:
-            new_balance = self.transactions[transaction_id]["new_balance"]
+            new_balance = self.transactions[transaction_id].new_balance
             log_event("commit", self.account_id, new_balance, None)
             self.set_balance(new_balance)
-            del self.transactions[transaction_id] 
-            return {"result": {"canCommit": True},}
+            del self.transactions[transaction_id]
+            response = {"result": {"canCommit": True},}
+            self._remember(transaction_id, "commit", response)
+            return response
         else:
             return {"result": {"canCommit": False}, "error": "Transaction not prepared"}
 
+    def handle_prepare_commit(self, new_balance, transaction_id):
+        """
+        Prepare and commit in one round-trip, for the coordinator's
+        single-outstanding-transaction fast path.
+        """
+        cached = self._applied.get((transaction_id, "commit"))
+        if cached is not None:
+            return cached
+
+        if new_balance < 0:
+            return {"result": {"canCommit": False}, "error": "Insufficient funds"}
+
+        log_event("prepare", self.account_id, new_balance, None)
+        self.set_balance(new_balance)
+        response = {"result": {"canCommit": True}, "error": None}
+        self._remember(transaction_id, "commit", response)
+        return response
+
     def handle_abort(self, transaction_id = None):
         """
         Handle the abort phase of the 2-Phase Commit Protocol.
         """
+        if transaction_id and (transaction_id, "abort") in self._applied:
+            return
+
         current_balance = self.get_balance()
         log_event("abort", self.account_id, current_balance, "Transaction aborted")
         if transaction_id:
-            print(f"Transaction {transaction_id} aborted.")
+            log.info("Transaction %s aborted.", transaction_id)
             if transaction_id in self.transactions:
                 del self.transactions[transaction_id]
+            self._remember(transaction_id, "abort", None)
         else:
             self.transactions.clear()
         
     def recover(self):
-        coordinator = None
-        for server in self.cluster:
-            if server["server_id"] == "coordinator":
-                coordinator = server
-                break
-            
+        coordinator = self._coordinator
         if not coordinator:
-            print("No coordinator found in the cluster. Recovery failed.")
+            log.warning("No coordinator found in the cluster. Recovery failed.")
             return
         
         try:
-            logs = rpc_call(coordinator, "get_logs", params={}).get("result", [])
-            relevant_logs = [log for log in logs
-            if log["account_id"] == self.account_id and log["state"] == "commit"]
-            
-            for log in relevant_logs:
-                new_balance = log["account_balance"]
-                print(f"Recovering: Applying committed balance {new_balance} for account {self.account_id}.")
-                update_account_balance(self.account_id, new_balance)
+            # Filter on the coordinator so only this account's commit
+            # records cross the wire instead of the whole log.
+            relevant_logs = rpc_call(
+                coordinator, "get_logs",
+                params={"account_id": self.account_id, "state": "commit"}
+            ).get("result", [])
+
+            for entry in relevant_logs:
+                new_balance = entry["account_balance"]
+                log.info("Recovering: Applying committed balance %s for account %s.", new_balance, self.account_id)
+                with self._balance_lock:
+                    self._balance = new_balance
+                    self._store.write(new_balance)
                 log_event(
                     state="recovered",
                     account_id=self.account_id,
@@ -130,15 +206,15 @@ class ParticipantServer(BaseServer):
                     error=None
                 )
             if relevant_logs:
-                print(f"Recovery complete for account {self.account_id}.")
+                log.info("Recovery complete for account %s.", self.account_id)
             else:
-                print(f"No committed logs found for account {self.account_id}. Recovery not needed.")
+                log.info("No committed logs found for account %s. Recovery not needed.", self.account_id)
                 
         except Exception as e:
-            print(f"Failed to recover state for account {self.account_id}: {e}")
+            log.warning("Failed to recover state for account %s: %s", self.account_id, e)
 
     def mock_failure(self):
-        print(f"Simulating failure: Sleeping for 10 seconds.")
+        log.info("Simulating failure: Sleeping for 10 seconds.")
         g.server_busy = True
         try:
             time.sleep(10)
@@ -157,6 +233,8 @@ if __name__ == "__main__":
                         help="Account ID for participants (ignored for coordinator)")
     parser.add_argument("account_balance", type=float, nargs="?",
                         help="Initial balance for participants (ignored for coordinator)")
+    parser.add_argument("--debug", action="store_true",
+                        help="Run the Flask dev server with the debugger/reloader")
 
     args = parser.parse_args()
 
@@ -165,6 +243,7 @@ if __name__ == "__main__":
         host=args.host,
         port=args.port,
         account_id=args.account_id,
-        account_balance=args.account_balance or 0.0
+        account_balance=args.account_balance or 0.0,
+        debug=args.debug
     )
     server.run()
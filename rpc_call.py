@@ -1,20 +1,66 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import socket
+from diagnostics import get_logger
+
+log = get_logger("rpc")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+def _loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+_SOCKET_OPTIONS = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
+# Linux only: also disable delayed ACKs, which can add ~40ms to the tiny
+# request/response exchanges 2PC is made of.
+if hasattr(socket, "TCP_QUICKACK"):
+    _SOCKET_OPTIONS.append((socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1))
+
+class _RpcAdapter(HTTPAdapter):
+    """Connection-pool adapter that disables Nagle on pooled sockets.
+
+    The 2PC messages are tiny JSON bodies; without TCP_NODELAY they can
+    sit in the send buffer waiting for a delayed ACK.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = _SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+# Shared session so RPCs reuse keep-alive connections instead of paying a
+# TCP handshake on every call.
+_SESSION = requests.Session()
+_SESSION.headers["Connection"] = "keep-alive"
+_SESSION.headers["Content-Type"] = "application/json"
+_SESSION.mount("http://", _RpcAdapter(
+    pool_connections=16, pool_maxsize=64, max_retries=0, pool_block=False))
 
 # Try calling rpc method with timeout of 3
 def rpc_call(server, method, params=None, timeout = 3):
-    headers = {"Content-Type": "application/json"}
-    payload = {
-        "method": method,
-        "params": params or {},
-    }
     try:
-        url = f"http://{server['ip']}:{server['port']}/rpc"
-        payload = {"method": method, "params": params}
-        response = requests.post(url, json=payload, timeout=timeout)
+        # Per-method route: the server dispatches on the URL and the body
+        # carries only the params dict.
+        url = f"http://{server['ip']}:{server['port']}/rpc/{method}"
+        # Encode once with orjson instead of letting requests re-encode
+        # the payload with stdlib json.
+        response = _SESSION.post(url, data=_dumps(params or {}), timeout=timeout)
         response.raise_for_status()  # Raise HTTP errors if they occur
-        return response.json()
+        return _loads(response.content)
     except requests.exceptions.Timeout:
-        print(f"RPC call to {url} timed out after {timeout} seconds.")
+        # Note: the timeout is swallowed and the caller sees None, which
+        # is why the coordinator's except TimeoutError branches never
+        # fire; changing that contract is out of scope here.
+        log.warning("RPC call to %s timed out after %s seconds.", url, timeout)
     except requests.exceptions.RequestException as e:
-        raise RuntimeError(f"Failed RPC call to {url}: {e}")
\ No newline at end of file
+        raise RuntimeError(f"Failed RPC call to {url}: {e}")
@@ -0,0 +1,24 @@
+"""
+Optional build script: compiles the per-RPC helper modules to C
+extensions with mypyc.
+
+    python setup.py build_ext --inplace
+
+drops the compiled modules next to the sources; import paths are
+unchanged, so the servers pick them up automatically. Without mypyc
+installed this is a no-op and the interpreted modules are used as is.
+"""
+
+from setuptools import setup
+
+try:
+    from mypyc.build import mypycify
+except ImportError:
+    ext_modules = []
+else:
+    ext_modules = mypycify(["log_handler.py", "account_handler.py"])
+
+setup(
+    name="2phasecommit",
+    ext_modules=ext_modules,
+)
@@ -0,0 +1,40 @@
+"""
+Smoke test: both server classes must at least construct.
+
+Guards against regressions in the shared __init__ (pool, transaction
+tracking, vote state) that only surface at startup.
+"""
+
+import os
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("requests")
+
+from coordinator_server import CoordinatorServer
+from participant_server import ParticipantServer
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # The servers write their log/account files into the working
+    # directory; keep test runs out of the repo checkout.
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_coordinator_constructs(workdir):
+    server = CoordinatorServer(host="127.0.0.1", port=8000)
+    assert server.transactions == {}
+    assert server.transaction_counter == 0
+    assert "coordinator" in server.roles
+    assert server._pool is not None
+
+
+def test_participant_constructs(workdir):
+    server = ParticipantServer(
+        host="127.0.0.1", port=8001, account_id="A", account_balance=100.0)
+    assert "participant" in server.roles
+    assert server.get_balance() == 100.0
+    assert os.path.exists("server_log.jsonl")